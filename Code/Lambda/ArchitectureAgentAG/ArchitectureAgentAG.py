@@ -0,0 +1,320 @@
+import logging
+import os
+import json
+import re
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from functools import lru_cache
+from operator import itemgetter
+from urllib.parse import quote
+from typing import Dict, Any, Iterable, Callable, NamedTuple
+
+try:
+    import orjson
+
+    def json_dumps(obj: Any) -> str:
+        """Serialize obj to a JSON string using orjson."""
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    json_dumps = json.dumps
+
+# Configuration
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(logging.INFO)
+
+S3_BUCKET = os.getenv('WORKSPACES_BUCKET', '')
+PRESIGN_EXPIRES_IN = int(os.environ['PRESIGN_EXPIRES_IN']) if 'PRESIGN_EXPIRES_IN' in os.environ else 3600
+
+# Invocation-invariant presign parameters; only 'Key' is set per call
+PRESIGN_PARAMS = {'Bucket': S3_BUCKET, 'Key': None, 'ContentType': 'image/png'}
+
+# SigV4 query-signing constants for presigned PUT URLs
+SIGV4_ALGORITHM = 'AWS4-HMAC-SHA256'
+SIGV4_SIGNED_HEADERS = 'content-type;host'
+SIGV4_UNSIGNED_PAYLOAD = 'UNSIGNED-PAYLOAD'
+
+# Allowed upload extensions (lowercase); the filename tail is only lowercased when the exact match fails
+ALLOWED_EXTENSIONS = ('.png',)
+MAX_EXTENSION_LENGTH = max(len(ext) for ext in ALLOWED_EXTENSIONS)
+# Relative S3 key made of safe characters: no leading slash, empty segments or '..' segments
+FILENAME_PATTERN = re.compile(r'\A(?!(?:.*/)?\.\.(?:/|\Z))[\w\-. ]+(?:/[\w\-. ]+)*\Z')
+
+# Success body skeleton; only the JSON-encoded URL is interpolated per call
+PRESIGNED_URL_BODY = '{{"<PresignedURL>": {}}}'
+
+# AWS clients (created lazily, once per execution environment)
+S3_CLIENT_CONFIG = {
+    'signature_version': 's3v4',
+    'tcp_keepalive': True,
+    'max_pool_connections': 1,
+    'retries': {'max_attempts': 1, 'mode': 'standard'}
+}
+_s3_client = None
+
+# Extracts the required dispatch fields in one call; raises KeyError naming the missing field
+get_dispatch_fields = itemgetter('actionGroup', 'function')
+
+# Type Aliases
+Event = Dict[str, Any]
+Response = Dict[str, Any]
+
+
+class AgentRequest(NamedTuple):
+    """Bedrock agent event fields, decoded once per invocation."""
+    action_group: str
+    function: str
+    version: str
+    params: Dict[str, Any]
+
+
+def get_s3_client() -> Any:
+    """
+    Return the S3 client, creating it on first use.
+
+    Key steps:
+        1. Import botocore and build a low-level client only when a handler needs it.
+        2. Cache the client at module scope for warm invocations.
+
+    Returns:
+        Any: botocore S3 client
+    """
+    global _s3_client
+    if _s3_client is None:
+        import botocore.session
+        from botocore.config import Config
+        LOGGER.info("IN ArchitectureAgentAG.get_s3_client: Initializing S3 client")
+        _s3_client = botocore.session.get_session().create_client(
+            's3',
+            region_name=os.getenv('AWS_REGION'),
+            config=Config(**S3_CLIENT_CONFIG)
+        )
+    return _s3_client
+
+
+@lru_cache(maxsize=4)
+def derive_signing_key(secret_key: str, date_stamp: str, region: str) -> bytes:
+    """
+    Derive (and cache per day) the SigV4 signing key for S3.
+
+    Key steps:
+        1. Chain HMAC-SHA256 over date, region, service and terminator.
+
+    Params:
+        secret_key [str]: AWS secret access key
+        date_stamp [str]: signing date as YYYYMMDD
+        region [str]: AWS region of the bucket
+
+    Returns:
+        bytes: signing key for the credential scope
+    """
+    key = ('AWS4' + secret_key).encode('utf-8')
+    for part in (date_stamp, region, 's3', 'aws4_request'):
+        key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+    return key
+
+
+def presign_put_url(key: str, content_type: str, expires_in: int) -> str:
+    """
+    Build a SigV4 presigned S3 PUT URL without going through botocore.
+
+    Key steps:
+        1. Read the execution-role credentials and region from the environment.
+        2. Fall back to the botocore client when they are missing or the bucket
+           cannot be addressed virtual-host style.
+        3. Build the canonical request and sign it with the cached signing key.
+
+    Params:
+        key [str]: S3 object key
+        content_type [str]: Content-Type the uploader must send
+        expires_in [int]: URL lifetime in seconds
+
+    Returns:
+        str: presigned URL
+    """
+    access_key = os.getenv('AWS_ACCESS_KEY_ID')
+    secret_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+    region = os.getenv('AWS_REGION')
+    if not (access_key and secret_key and region) or '.' in S3_BUCKET:
+        presign_params = PRESIGN_PARAMS.copy()
+        presign_params['Key'] = key
+        return get_s3_client().generate_presigned_url(ClientMethod='put_object', Params=presign_params, ExpiresIn=expires_in)
+
+    now = datetime.now(timezone.utc)
+    amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+    date_stamp = amz_date[:8]
+    credential_scope = f'{date_stamp}/{region}/s3/aws4_request'
+    host = f'{S3_BUCKET}.s3.{region}.amazonaws.com'
+    canonical_uri = '/' + quote(key, safe='/~')
+
+    query = {
+        'X-Amz-Algorithm': SIGV4_ALGORITHM,
+        'X-Amz-Credential': f'{access_key}/{credential_scope}',
+        'X-Amz-Date': amz_date,
+        'X-Amz-Expires': str(expires_in),
+        'X-Amz-SignedHeaders': SIGV4_SIGNED_HEADERS,
+    }
+    session_token = os.getenv('AWS_SESSION_TOKEN')
+    if session_token:
+        query['X-Amz-Security-Token'] = session_token
+    canonical_query = '&'.join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}" for k, v in sorted(query.items()))
+
+    canonical_request = (
+        f'PUT\n{canonical_uri}\n{canonical_query}\n'
+        f'content-type:{content_type}\nhost:{host}\n\n'
+        f'{SIGV4_SIGNED_HEADERS}\n{SIGV4_UNSIGNED_PAYLOAD}'
+    )
+    string_to_sign = (
+        f'{SIGV4_ALGORITHM}\n{amz_date}\n{credential_scope}\n'
+        f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+    )
+    signature = hmac.new(derive_signing_key(secret_key, date_stamp, region), string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f'https://{host}{canonical_uri}?{canonical_query}&X-Amz-Signature={signature}'
+
+
+def parse_parameters(parameters: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Index a Bedrock agent parameter list by name.
+
+    Key steps:
+        1. Build a {name: value} dict in a single pass over the list.
+
+    Params:
+        parameters [Iterable[Dict[str, Any]]]: list of {'name': ..., 'value': ...} dicts
+
+    Returns:
+        Dict[str, Any]: parameter values keyed by name
+    """
+    return {param.get('name'): param.get('value') for param in parameters}
+
+
+def decode_event(event: Event) -> AgentRequest:
+    """
+    Decode the fields every handler needs from a Bedrock agent event.
+
+    Key steps:
+        1. Read actionGroup and function (KeyError names a missing field).
+        2. Default messageVersion and index the parameters by name.
+
+    Params:
+        event [Event]: the incoming Bedrock agent event payload
+
+    Returns:
+        AgentRequest: decoded request
+    """
+    action_group, function = get_dispatch_fields(event)
+    return AgentRequest(action_group, function, event.get('messageVersion', '1.0'), parse_parameters(event.get('parameters', ())))
+
+
+def build_agent_response(action_group: str, function: str, version: str, body: str) -> Response:
+    """
+    Assemble the Bedrock agent response envelope in a single dict literal.
+
+    Callers format the body themselves: error bodies are prefixed with
+    'Error: ' and success bodies are JSON text.
+
+    The Lambda runtime serializes the returned dict and Bedrock expects that
+    object shape, so the envelope is not pre-rendered to a JSON string.
+
+    Key steps:
+        1. Place actionGroup, function and the TEXT body in the 'response' structure.
+        2. Include the messageVersion for client compatibility.
+
+    Params:
+        action_group [str]: identifier of the action group
+        function [str]: name of the function being invoked
+        version [str]: message version identifier
+        body [str]: already-formatted response body text; must be str, not bytes,
+            because the runtime JSON-encodes the envelope
+
+    Returns:
+        Response: formatted agent payload
+    """
+    return {
+        'response': {
+            'actionGroup': action_group,
+            'function': function,
+            'functionResponse': {'responseBody': {'TEXT': {'body': body}}}
+        },
+        'messageVersion': version
+    }
+
+
+def handle_presigned_url(request: AgentRequest) -> Response:
+    """
+    Generate an S3 presigned PUT URL for PNG files only.
+
+    Key steps:
+        1. Extract filename parameter and validate presence.
+        2. Enforce .png extension requirement and reject unsafe keys.
+        3. Generate and return the presigned URL.
+
+    Params:
+        request [AgentRequest]: the decoded Bedrock agent request
+
+    Returns:
+        Response: either an error or success payload with the presigned URL
+    """
+    LOGGER.debug("IN ArchitectureAgentAG.handle_presigned_url: Starting PresignedURL handler")
+    action_group, function, version, params = request
+
+    # Validation failures use the agent envelope (not an HTTP 400) so the agent reads the reason and can retry
+    filename = params.get('filename')
+    if not filename:
+        LOGGER.error("IN ArchitectureAgentAG.handle_presigned_url: Missing 'filename' parameter")
+        return build_agent_response(action_group, function, version, 'Error: Missing "filename" parameter')
+
+    if not (filename.endswith(ALLOWED_EXTENSIONS) or filename[-MAX_EXTENSION_LENGTH:].lower().endswith(ALLOWED_EXTENSIONS)):
+        LOGGER.error("IN ArchitectureAgentAG.handle_presigned_url: Invalid file extension for %s", filename)
+        return build_agent_response(action_group, function, version, 'Error: Only PNG files are allowed')
+
+    if not FILENAME_PATTERN.match(filename):
+        LOGGER.error("IN ArchitectureAgentAG.handle_presigned_url: Invalid filename %s", filename)
+        return build_agent_response(action_group, function, version, 'Error: Invalid "filename" parameter')
+
+    url = presign_put_url(filename, PRESIGN_PARAMS['ContentType'], PRESIGN_EXPIRES_IN)
+    LOGGER.info("IN ArchitectureAgentAG.handle_presigned_url: Generated presigned URL for %s.%s, key %s", action_group, function, filename)
+    return build_agent_response(action_group, function, version, PRESIGNED_URL_BODY.format(json_dumps(url)))
+
+
+# Mapping of function names to handlers (synchronous: presigning is local signing with no I/O to overlap)
+HANDLERS: Dict[str, Callable[[AgentRequest], Response]] = {
+    'PresignedURL': handle_presigned_url
+}
+
+
+def lambda_handler(event: Event, context: Any) -> Any:
+    """
+    Entrypoint for AWS Lambda to process Bedrock agent actions.
+
+    Key steps:
+        1. Decode and validate required event fields.
+        2. Dispatch to the appropriate handler based on 'function'.
+        3. Return HTTP or agent-style response.
+
+    Params:
+        event [Event]: AWS Lambda event payload
+        context [Any]: AWS Lambda context object
+
+    Returns:
+        Any: either an HTTP response dict or an agent response payload
+    """
+    if LOGGER.isEnabledFor(logging.DEBUG):
+        LOGGER.debug("IN ArchitectureAgentAG.lambda_handler: Received event: %s", event)
+    try:
+        request = decode_event(event)
+    except KeyError as e:
+        LOGGER.error("IN ArchitectureAgentAG.lambda_handler: Missing event field: %s", e)
+        return {
+            'statusCode': 400,
+            'body': f'Missing required field: {e}'
+        }
+
+    LOGGER.debug("IN ArchitectureAgentAG.lambda_handler: Dispatching to handler for %s.%s", request.action_group, request.function)
+    try:
+        handler = HANDLERS[request.function]
+    except KeyError:
+        LOGGER.error("IN ArchitectureAgentAG.lambda_handler: Unsupported function: %s", request.function)
+        return build_agent_response(request.action_group, request.function, request.version, f'Error: Unknown function: {request.function}')
+
+    return handler(request)
@@ -2,39 +2,112 @@ import json
 import boto3
 import os
 import time
+import hashlib
+import random
 import logging
+from io import BytesIO
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from botocore.waiter import WaiterModel
 
-bedrock_agent_runtime = boto3.client("bedrock-agent-runtime")
-s3_client = boto3.client("s3")
-cf = boto3.client('cloudformation')
-sc = boto3.client('servicecatalog')
-sfn_client = boto3.client('stepfunctions')
-DYNAMO_DB = boto3.resource('dynamodb')
+try:
+    import orjson
+
+    def json_dumps(obj):
+        """Serializes obj to a compact JSON string using orjson."""
+        return orjson.dumps(obj).decode('utf-8')
+except ImportError:
+    def json_dumps(obj):
+        """Serializes obj to a compact JSON string using the standard library."""
+        return json.dumps(obj, separators=(',', ':'))
+
+# Shared client config: keep-alive connections, a larger pool and adaptive retries for throttled SC/CFN calls
+BOTO_CONFIG = Config(
+    tcp_keepalive=True,
+    max_pool_connections=50,
+    retries={"max_attempts": 10, "mode": "adaptive"},
+    connect_timeout=3,
+    read_timeout=30
+)
+
+# Clients are created on first use and reused for the life of the container
+CLIENTS = {}
 SOLUTIONS_TABLE_NAME = os.environ.get("SOLUTIONS_TABLE")
-SOLUTIONS_TABLE = DYNAMO_DB.Table(SOLUTIONS_TABLE_NAME)
+SOLUTIONS_TABLE = None
 
 KNOWLEDGE_BASE_ID = "1IRBPZU9KF"
 MODEL_ARN = "arn:aws:bedrock:us-east-1::foundation-model/anthropic.claude-3-5-sonnet-20240620-v1:0"
 S3_OUTPUT_BUCKET = "develop-service-workbench-workspaces" 
 
+# CFTs under the threshold go up in a plain PutObject; larger ones use parallel multipart parts.
+# The object is stored uncompressed: Service Catalog and CloudFormation read it via TemplateURL and don't decode gzip.
+CFT_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True
+)
+
+# Agent reply for a successful upload; it never varies, so it is serialized once
+UPLOAD_SUCCESS_MESSAGE = json.dumps({"UploadStatus": "Success", "<codegenerated>": "true"})
+
 PORTFOLIO_ID = "port-po3aqdmed72ig"
 PROVISIONED_PRODUCT_NAME_PREFIX = "AgentProvisionedProduct"
 
 STEP_FUNCTION_ARN = "arn:aws:states:us-east-1:043309350924:stateMachine:wb-test-stepfunction"
-LOGGER = logging.getLogger()
-LOGGER.setLevel(logging.INFO)
-
-# Global variable to store S3 object key
-GLOBAL_S3_OBJECT_KEY = None
+# How deploycft runs provision/poll/finalize:
+#   "sync"         - inside the agent call (default)
+#   "stepfunction" - hand off to STEP_FUNCTION_ARN and return immediately
+#   "lambda"       - re-invoke this function asynchronously as a worker and return immediately
+DEPLOY_MODE = os.environ.get("DEPLOY_MODE", "sync").lower()
+# When enabled, deployments create the CloudFormation stack directly instead of going through a Service Catalog product.
+# Only the sync and lambda modes support it; the Step Function phases are built around a Service Catalog record.
+USE_DIRECT_CFN = os.environ.get("USE_DIRECT_CFN", "false").lower() == "true"
+# CloudFormation service role for direct stack deployments (required when USE_DIRECT_CFN is set)
+CFN_ROLE_ARN = os.environ.get("CFN_ROLE_ARN")
+# Seconds kept back from the Lambda timeout when the Step Function poll phase waits in-process
+POLL_TIME_MARGIN = 30
+# Keys carried from one Step Function phase to the next
+PHASE_CONTEXT_KEYS = ("workspace_id", "solution_id", "invoke_point")
+# execute_polling_phase backoff (seconds): first delay, delay cap and overall budget kept under the Lambda timeout
+RECORD_POLL_BASE_DELAY = 2.0
+RECORD_POLL_MAX_DELAY = 60.0
+RECORD_POLL_MAX_WAIT = 840
+# Service Catalog ships no waiters, so describe_record terminal states are defined as a custom one.
+# Its acceptors drive execute_polling_phase, which adds backoff (botocore waiters only sleep a fixed delay).
+# delay/maxAttempts are required by the waiter schema and only mirror the polling bounds above.
+RECORD_WAITER_MODEL = WaiterModel({
+    "version": 2,
+    "waiters": {
+        "RecordSucceeded": {
+            "delay": int(RECORD_POLL_BASE_DELAY),
+            "maxAttempts": int(RECORD_POLL_MAX_WAIT // RECORD_POLL_BASE_DELAY),
+            "operation": "DescribeRecord",
+            "acceptors": [
+                {"matcher": "path", "expected": "SUCCEEDED", "argument": "RecordDetail.Status", "state": "success"},
+                {"matcher": "path", "expected": "FAILED", "argument": "RecordDetail.Status", "state": "failure"},
+                {"matcher": "path", "expected": "ERROR", "argument": "RecordDetail.Status", "state": "failure"}
+            ]
+        }
+    }
+})
+RECORD_ACCEPTORS = RECORD_WAITER_MODEL.get_waiter("RecordSucceeded").acceptors
+# Module logger: records propagate to the runtime's root handler, and LOG_LEVEL no longer changes boto3's level
+LOGGER = logging.getLogger(__name__)
+LOGGER.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
 
-# Add global variables at the top
-workspace_id = None
-solution_id = None
+# Account ID and region, resolved once per container by get_account_and_region()
+ACCOUNT_ID = None
+REGION = None
 
 def build_agent_response(event, text):
     """
     Constructs the response body for the Bedrock Agent.
     
+    The envelope is built as one dict literal on purpose: deep-copying a module-level
+    skeleton costs more than building it, and a shared skeleton could leak fields between invocations.
+    
     Key Steps:
         1. Extract action group and function information from event
         2. Format response body with TEXT content
@@ -48,26 +121,93 @@ def build_agent_response(event, text):
     Returns:
         dict: Formatted response object for Bedrock Agent
     """
-    LOGGER.info("In CFTGenerationAgentLambda.py.build_agent_response(), building agent response")
     response = {
         "messageVersion": "1.0",
         "response": {
             "actionGroup": event.get("actionGroup", ""),
             "function": event.get("function", ""),
-            "functionResponse": {
-                "responseBody": {
-                    "TEXT": {
-                        "body": text
-                    }
-                }
-            },
+            "functionResponse": {"responseBody": {"TEXT": {"body": text}}},
         },
-        "sessionAttributes": event.get("sessionAttributes", {}),
-        "promptSessionAttributes": event.get("promptSessionAttributes", {})
+        "sessionAttributes": event.get("sessionAttributes") or {},
+        "promptSessionAttributes": event.get("promptSessionAttributes") or {}
     }
-    LOGGER.debug(f"In CFTGenerationAgentLambda.py.build_agent_response(), agent response: {response}")
+    LOGGER.debug("In CFTGenerationAgentLambda.py.build_agent_response(), agent response: %s", response)
     return response
 
+def redact_event(event):
+    """
+    Returns a copy of the event that is safe to log, with the CFT body replaced by its length.
+    
+    Parameters:
+        event (dict): Incoming Lambda event
+    
+    Returns:
+        dict: Shallow copy of the event with any 'cft' parameter value summarized
+    """
+    return {
+        **event,
+        "parameters": [
+            {**param, "value": f"<{len(param.get('value') or '')} chars>"} if param.get("name") == "cft" else param
+            for param in event.get("parameters") or []
+        ]
+    }
+
+def get_client(service_name):
+    """
+    Returns the boto3 client for a service, creating it on first use.
+    
+    Key Steps:
+        1. Return the cached client if one exists
+        2. Otherwise create it with the shared BOTO_CONFIG and cache it
+    
+    Parameters:
+        service_name (str): boto3 service name, e.g. 'servicecatalog'
+    
+    Returns:
+        botocore.client.BaseClient: The service client
+    """
+    client = CLIENTS.get(service_name)
+    if client is None:
+        client = CLIENTS[service_name] = boto3.client(service_name, config=BOTO_CONFIG)
+    return client
+
+def get_solutions_table():
+    """
+    Returns the solutions DynamoDB table, creating the resource on first use.
+    
+    Returns:
+        boto3 Table: The solutions table
+    """
+    global SOLUTIONS_TABLE
+    if SOLUTIONS_TABLE is None:
+        SOLUTIONS_TABLE = boto3.resource('dynamodb', config=BOTO_CONFIG).Table(SOLUTIONS_TABLE_NAME)
+    return SOLUTIONS_TABLE
+
+def get_account_and_region(context=None):
+    """
+    Returns the account ID and region, resolving them once per container.
+    
+    Key Steps:
+        1. Return cached values if already resolved
+        2. Parse them from the Lambda context's function ARN when a context is given
+        3. Otherwise read region from AWS_REGION (always set in Lambda)
+        4. Read account ID from AWS_ACCOUNT_ID, falling back to a single STS call
+    
+    Parameters:
+        context (object, optional): Lambda context whose invoked_function_arn carries region and account
+    
+    Returns:
+        tuple: (account_id, region)
+    """
+    global ACCOUNT_ID, REGION
+    if ACCOUNT_ID is None and context is not None:
+        arn_parts = context.invoked_function_arn.split(":")
+        REGION, ACCOUNT_ID = arn_parts[3], arn_parts[4]
+    if ACCOUNT_ID is None:
+        REGION = os.environ.get("AWS_REGION") or boto3.Session().region_name or "us-east-1"
+        ACCOUNT_ID = os.environ.get("AWS_ACCOUNT_ID") or get_client("sts").get_caller_identity()["Account"]
+    return ACCOUNT_ID, REGION
+
 def get_cft_s3_key(workspace_id, solution_id):
     """
     Returns the S3 key for the CFT file based on workspace and solution IDs.
@@ -90,7 +230,7 @@ def get_cft_s3_url(bucket, workspace_id, solution_id, region="us-east-1"):
     Returns the S3 URL for the CFT file based on workspace and solution IDs.
     
     Key Steps:
-        1. Construct S3 URL using bucket, region, and path
+        1. Construct S3 URL using bucket, region, and the key from get_cft_s3_key
         2. Return formatted URL string
     
     Parameters:
@@ -102,7 +242,22 @@ def get_cft_s3_url(bucket, workspace_id, solution_id, region="us-east-1"):
     Returns:
         str: Full S3 URL for the CFT file
     """
-    return f"https://{bucket}.s3.{region}.amazonaws.com/workspaces/{workspace_id}/solutions/{solution_id}/cft/cft.yaml"
+    return f"https://{bucket}.s3.{region}.amazonaws.com/{get_cft_s3_key(workspace_id, solution_id)}"
+
+def stored_cft_hash(s3_key):
+    """
+    Returns the SHA-256 recorded on the stored CFT object, or None if there is no such object.
+    
+    Parameters:
+        s3_key (str): S3 key of the CFT
+    
+    Returns:
+        str: The object's cftsha256 metadata value, or None
+    """
+    try:
+        return get_client('s3').head_object(Bucket=S3_OUTPUT_BUCKET, Key=s3_key).get('Metadata', {}).get('cftsha256')
+    except ClientError:
+        return None
 
 def handle_cft_upload(event):
     """
@@ -111,9 +266,11 @@ def handle_cft_upload(event):
     Key Steps:
         1. Extract CFT content and workspace/solution IDs from event parameters
         2. Validate required parameters are present
-        3. Generate S3 key and upload CFT content to S3
-        4. Update solution status to READY in DynamoDB
-        5. Return success response with upload status
+        3. Generate S3 key and upload CFT content to S3 (single PUT, or multipart for large CFTs)
+           with its SHA-256 digest as object metadata, skipping the upload when the stored object has the same digest
+        4. Record the S3 key and IDs in the agent session attributes
+        5. Update solution status to READY in DynamoDB (failures are logged, the upload still succeeds)
+        6. Return success response with upload status
     
     Parameters:
         event (dict): Event containing CFT content and workspace/solution IDs
@@ -121,23 +278,12 @@ def handle_cft_upload(event):
     Returns:
         dict: Agent response with upload status and success message
     """
-    global GLOBAL_S3_OBJECT_KEY
-    global workspace_id, solution_id
-    workspace_id = ""
-    solution_id = ""
-    
     LOGGER.info("In CFTGenerationAgentLambda.py.handle_cft_upload(), handling CFT upload to S3.")
     
-    cft_value = None
-    parameters = event.get("parameters", [])
-    
-    for param in parameters:
-        if param.get("name") == "cft":
-            cft_value = param.get("value")
-        elif param.get("name") == "workspace_id":
-            workspace_id = param.get("value")
-        elif param.get("name") == "solution_id":
-            solution_id = param.get("value")
+    params = {param.get("name"): param.get("value") for param in event.get("parameters") or []}
+    cft_value = params.get("cft")
+    workspace_id = params.get("workspace_id")
+    solution_id = params.get("solution_id")
     
     if not cft_value:
         return build_agent_response(event, "Missing required 'cft' input parameter.")
@@ -145,46 +291,64 @@ def handle_cft_upload(event):
         return build_agent_response(event, "Missing required 'workspace_id' or 'solution_id' input parameter.")
     
     s3_key = get_cft_s3_key(workspace_id, solution_id)
-    GLOBAL_S3_OBJECT_KEY = s3_key  # Store in global variable
     LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), attempting to upload CFT to s3://{S3_OUTPUT_BUCKET}/{s3_key}")
     
+    cft_bytes = cft_value.encode('utf-8')
+    template_hash = hashlib.sha256(cft_bytes).hexdigest()
     try:
-        s3_client.put_object(
-            Bucket=S3_OUTPUT_BUCKET,
-            Key=s3_key,
-            Body=cft_value.encode('utf-8'),
-            ContentType="text/yaml"
-        )
-        LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), successfully uploaded CFT to s3://{S3_OUTPUT_BUCKET}/{s3_key}")
-        s3_object_key_response = f"s3://{S3_OUTPUT_BUCKET}/{s3_key}"
-        response_message = json.dumps(
-            {
-                "UploadStatus": "Success",
-                "<codegenerated>":"true"
-            }
-        )
+        if stored_cft_hash(s3_key) == template_hash:
+            # The agent often re-uploads the same CFT; a HeadObject is cheaper than re-sending the body
+            LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), s3://{S3_OUTPUT_BUCKET}/{s3_key} already holds this CFT, skipping upload")
+        elif len(cft_bytes) < CFT_TRANSFER_CONFIG.multipart_threshold:
+            # Typical CFTs: skip the transfer manager and its thread pool
+            get_client('s3').put_object(
+                Bucket=S3_OUTPUT_BUCKET,
+                Key=s3_key,
+                Body=cft_bytes,
+                ContentType="text/yaml",
+                Metadata={"cftsha256": template_hash}
+            )
+        else:
+            get_client('s3').upload_fileobj(
+                BytesIO(cft_bytes),
+                S3_OUTPUT_BUCKET,
+                s3_key,
+                ExtraArgs={"ContentType": "text/yaml", "Metadata": {"cftsha256": template_hash}},
+                Config=CFT_TRANSFER_CONFIG
+            )
+        LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), CFT is stored at s3://{S3_OUTPUT_BUCKET}/{s3_key}")
+        # The agent echoes sessionAttributes back on later calls, so deploycft can find the upload
+        event["sessionAttributes"] = {
+            **(event.get("sessionAttributes") or {}),
+            "s3_object_key": s3_key,
+            "workspace_id": workspace_id,
+            "solution_id": solution_id
+        }
 
-        if workspace_id and solution_id:
-            try:
-                SOLUTIONS_TABLE.update_item(
-                    Key={
-                        'WorkspaceId': workspace_id,
-                        'SolutionId': solution_id
-                    },
-                    UpdateExpression='SET #s = :ready',
-                    ExpressionAttributeNames={
-                        '#s': 'SolutionStatus'
-                    },
-                    ExpressionAttributeValues={
-                        ':ready': 'READY'
-                    },
-                    ReturnValues='UPDATED_NEW'
-                )
-                LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), successfully updated solution status to READY for workspace {workspace_id}, solution {solution_id}")
-            except Exception as e:
-                LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), error updating solution status to READY: {e}")
+        solutions_table = get_solutions_table()
+        try:
+            # Skip the write when the solution is already READY (repeated or racing uploads)
+            solutions_table.update_item(
+                Key={
+                    'WorkspaceId': workspace_id,
+                    'SolutionId': solution_id
+                },
+                UpdateExpression='SET #s = :ready',
+                ConditionExpression='attribute_not_exists(#s) OR #s <> :ready',
+                ExpressionAttributeNames={
+                    '#s': 'SolutionStatus'
+                },
+                ExpressionAttributeValues={
+                    ':ready': 'READY'
+                }
+            )
+            LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), successfully updated solution status to READY for workspace {workspace_id}, solution {solution_id}")
+        except solutions_table.meta.client.exceptions.ConditionalCheckFailedException:
+            LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), solution {solution_id} already READY")
+        except Exception as e:
+            LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), error updating solution status to READY: {e}")
 
-        return build_agent_response(event, response_message)
+        return build_agent_response(event, UPLOAD_SUCCESS_MESSAGE)
     except Exception as e:
         LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_cft_upload(), error uploading CFT to S3: {e}")
         return build_agent_response(event, f"Error uploading CFT to S3: {str(e)}")
@@ -196,12 +360,10 @@ def handle_deploy(event):
     
     Key Steps:
         1. Extract approval and invoke_point parameters from event
-        2. Validate approval and CFT upload status
-        3. Execute provisioning phase (create product and provision)
-        4. Poll for completion status
-        5. Finalize deployment and extract resources
-        6. Store invoke_point in solutions table
-        7. Return deployment success response
+        2. Validate approval and CFT upload status from the session attributes
+        3. Hand off to the Step Function or a worker invocation when DEPLOY_MODE says so
+        4. Otherwise run provision, poll and finalize via run_deploy_pipeline
+        5. Return deployment success response
     
     Parameters:
         event (dict): Event containing deployment parameters and approval status
@@ -209,86 +371,328 @@ def handle_deploy(event):
     Returns:
         dict: Agent response with deployment status and resource information
     """
-    global GLOBAL_S3_OBJECT_KEY
-    global workspace_id, solution_id
     LOGGER.info("In CFTGenerationAgentLambda.py.handle_deploy(), handling deployment - executing Service Catalog provisioning synchronously.")
+
+    # Upload details come back from the agent session, so they survive a different container
+    session_attributes = event.get("sessionAttributes") or {}
+    s3_object_key = session_attributes.get("s3_object_key")
+    workspace_id = session_attributes.get("workspace_id")
+    solution_id = session_attributes.get("solution_id")
     
     # Extract parameters
-    approval = None
-    invoke_point = None
-    parameters = event.get("parameters", [])
-    for param in parameters:
-        if param.get("name") == "approval":
-            approval = param.get("value")
-        elif param.get("name") == "invoke_point":
-            invoke_point = param.get("value")
+    params = {param.get("name"): param.get("value") for param in event.get("parameters") or []}
+    approval = params.get("approval")
+    invoke_point = params.get("invoke_point")
     
     if approval != "true":
         return build_agent_response(event, "Deployment not approved. Please provide approval=true to proceed with deployment.")
-    if not GLOBAL_S3_OBJECT_KEY or not workspace_id or not solution_id:
+    if not s3_object_key or not workspace_id or not solution_id:
         return build_agent_response(event, "No CFT has been uploaded yet or missing workspace/solution id. Please upload a CFT first using the cftUpload function.")
     
-    LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_deploy(), using S3 object key: {GLOBAL_S3_OBJECT_KEY}")
+    LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_deploy(), using S3 object key: {s3_object_key}")
     LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_deploy(), invoke point: {invoke_point}")
+
+    if DEPLOY_MODE == "stepfunction":
+        if USE_DIRECT_CFN:
+            return build_agent_response(event, "Direct CloudFormation deployment is not supported with DEPLOY_MODE=stepfunction.")
+        return start_deploy_execution(event, workspace_id, solution_id, invoke_point)
+    if DEPLOY_MODE == "lambda":
+        return start_deploy_worker(event, workspace_id, solution_id, invoke_point)
+
+    result = run_deploy_pipeline(workspace_id, solution_id, invoke_point)
+    if result.get("phase") == "error":
+        return build_agent_response(event, result["error_message"])
+
+    # Success response
+    success_message = json_dumps({
+        "Status": "Success",
+        "Message": "Deployment completed successfully",
+        "CloudFormationStackARN": result.get("CloudFormationStackARN"),
+        "ProvisionedProductName": result.get("ProvisionedProductName"),
+        "Resources": result.get("Resources", [])
+    })
+    return build_agent_response(event, success_message)
+
+def run_deploy_pipeline(workspace_id, solution_id, invoke_point):
+    """
+    Runs the provision, poll and finalize phases for an uploaded CFT.
+    
+    Key Steps:
+        1. Deploy the stack directly when USE_DIRECT_CFN is set, else:
+        2. Execute provisioning phase (create product and provision)
+        3. Poll for completion status
+        4. Finalize deployment and extract resources
+        5. Store resources and invoke_point in the solutions table in one update
+        6. Return the finalize result or an error result
     
+    Parameters:
+        workspace_id (str): Workspace identifier
+        solution_id (str): Solution identifier
+        invoke_point (str): Invoke point to store once the deployment finishes
+    
+    Returns:
+        dict: Finalize result, or {"phase": "error", "error_message": ...}
+    """
     try:
         # Extract any additional parameters for provisioning
         provisioning_parameters = []
         tags = []
+        if USE_DIRECT_CFN:
+            finalize_result = execute_direct_cfn_deploy(provisioning_parameters, tags, workspace_id, solution_id)
+            if finalize_result.get("phase") == "error":
+                return {"phase": "error", "error_message": f"Provisioning failed: {finalize_result.get('error_message')}"}
+            store_deploy_result(workspace_id, solution_id, finalize_result["Resources"], invoke_point)
+            return finalize_result
         # Phase 1: Provision
-        LOGGER.info("In CFTGenerationAgentLambda.py.handle_deploy(), starting provisioning phase...")
+        LOGGER.info("In CFTGenerationAgentLambda.py.run_deploy_pipeline(), starting provisioning phase...")
         provision_result = execute_provision_phase(provisioning_parameters, tags, workspace_id, solution_id)
         if provision_result.get("phase") == "error":
-            return build_agent_response(event, f"Provisioning failed: {provision_result.get('error_message')}")
+            return {"phase": "error", "error_message": f"Provisioning failed: {provision_result.get('error_message')}"}
         record_id = provision_result["RecordId"]
         provisioned_product_name = provision_result["provisioned_product_name"]
         # Phase 2: Poll until completion
-        LOGGER.info("In CFTGenerationAgentLambda.py.handle_deploy(), starting polling phase...")
+        LOGGER.info("In CFTGenerationAgentLambda.py.run_deploy_pipeline(), starting polling phase...")
         poll_result = execute_polling_phase(record_id, provisioned_product_name)
         if poll_result.get("phase") == "error":
-            return build_agent_response(event, f"Provisioning failed during polling: {poll_result.get('error_message')}")
+            return {"phase": "error", "error_message": f"Provisioning failed during polling: {poll_result.get('error_message')}"}
         # Phase 3: Finalize
-        LOGGER.info("In CFTGenerationAgentLambda.py.handle_deploy(), starting finalization phase...")
-        finalize_result = execute_finalize_phase(record_id, provisioned_product_name)
+        LOGGER.info("In CFTGenerationAgentLambda.py.run_deploy_pipeline(), starting finalization phase...")
+        finalize_result = execute_finalize_phase(record_id, provisioned_product_name, poll_result.get("Record"))
         if finalize_result.get("phase") == "error":
-            return build_agent_response(event, f"Provisioning failed during finalization: {finalize_result.get('error_message')}")
+            return {"phase": "error", "error_message": f"Provisioning failed during finalization: {finalize_result.get('error_message')}"}
         
-        # Store invoke_point in solutions table if provided
-        if invoke_point and workspace_id and solution_id:
-            try:
-                SOLUTIONS_TABLE.update_item(
-                    Key={
-                        'WorkspaceId': workspace_id,
-                        'SolutionId': solution_id
-                    },
-                    UpdateExpression='SET #invoke = :invoke_point',
-                    ExpressionAttributeNames={
-                        '#invoke': 'Invocation'
-                    },
-                    ExpressionAttributeValues={
-                        ':invoke_point': invoke_point
-                    },
-                    ReturnValues='UPDATED_NEW'
-                )
-                LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_deploy(), successfully stored invoke_point '{invoke_point}' in solutions table")
-            except Exception as e:
-                LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_deploy(), error storing invoke_point in solutions table: {e}")
+        store_deploy_result(workspace_id, solution_id, finalize_result["Resources"], invoke_point)
+        return finalize_result
+    except Exception as e:
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.run_deploy_pipeline(), error during deployment: {e}")
+        return {"phase": "error", "error_message": f"Error during deployment: {str(e)}"}
 
-        # Update solution status to READY after successful deployment
-        
-        
-        # Success response
-        success_message = json.dumps({
-            "Status": "Success",
-            "Message": "Deployment completed successfully",
-            "CloudFormationStackARN": finalize_result.get("CloudFormationStackARN"),
-            "ProvisionedProductName": finalize_result.get("ProvisionedProductName"),
-            "Resources": finalize_result.get("Resources", [])
-        }, indent=2)
-        return build_agent_response(event, success_message)
+def start_deploy_worker(event, workspace_id, solution_id, invoke_point):
+    """
+    Re-invokes this Lambda asynchronously to run the deployment and returns to the agent without waiting.
+    
+    Key Steps:
+        1. Build the 'worker_pipeline' phase payload with workspace/solution IDs and invoke point
+        2. Invoke this function with InvocationType='Event' (deploy.yaml disables async retries,
+           so a failed worker is not re-run into duplicate products or stacks)
+        3. Return a deployment-started response to the agent
+    
+    Parameters:
+        event (dict): The original agent event
+        workspace_id (str): Workspace identifier
+        solution_id (str): Solution identifier
+        invoke_point (str): Invoke point to store once the deployment finishes
+    
+    Returns:
+        dict: Agent response confirming the deployment was started
+    """
+    LOGGER.info("In CFTGenerationAgentLambda.py.start_deploy_worker(), starting asynchronous deployment worker")
+    payload = {
+        "phase": "worker_pipeline",
+        "workspace_id": workspace_id,
+        "solution_id": solution_id,
+        "invoke_point": invoke_point
+    }
+    try:
+        get_client('lambda').invoke(
+            FunctionName=os.environ["AWS_LAMBDA_FUNCTION_NAME"],
+            InvocationType='Event',
+            Payload=json_dumps(payload)
+        )
+    except Exception as e:
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.start_deploy_worker(), error invoking deployment worker: {e}")
+        return build_agent_response(event, f"Error starting deployment: {str(e)}")
+
+    return build_agent_response(event, json_dumps({
+        "Status": "InProgress",
+        "Message": "Deployment started"
+    }))
+
+def start_deploy_execution(event, workspace_id, solution_id, invoke_point):
+    """
+    Starts the deployment Step Function and returns to the agent without waiting.
+    
+    The state machine must stay a STANDARD workflow: provisioning routinely outlives the
+    5-minute cap on EXPRESS executions (and StartSyncExecution), so the poll phase waits in-process instead.
+    
+    Key Steps:
+        1. Build the 'provision' phase input with workspace/solution IDs and invoke point
+        2. Start the Step Function execution
+        3. Return the execution ARN to the agent
+    
+    Parameters:
+        event (dict): The original agent event
+        workspace_id (str): Workspace identifier
+        solution_id (str): Solution identifier
+        invoke_point (str): Invoke point to store once the deployment finishes
+    
+    Returns:
+        dict: Agent response with the started execution ARN
+    """
+    LOGGER.info("In CFTGenerationAgentLambda.py.start_deploy_execution(), starting Step Function deployment execution")
+    sfn_input = {
+        "phase": "provision",
+        "workspace_id": workspace_id,
+        "solution_id": solution_id,
+        "invoke_point": invoke_point,
+        "provisioning_parameters": [],
+        "tags": []
+    }
+    try:
+        execution = get_client('stepfunctions').start_execution(
+            stateMachineArn=STEP_FUNCTION_ARN,
+            input=json_dumps(sfn_input)
+        )
     except Exception as e:
-        LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_deploy(), error during deployment: {e}")
-        return build_agent_response(event, f"Error during deployment: {str(e)}")
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.start_deploy_execution(), error starting Step Function execution: {e}")
+        return build_agent_response(event, f"Error starting deployment: {str(e)}")
+
+    LOGGER.info(f"In CFTGenerationAgentLambda.py.start_deploy_execution(), started execution {execution['executionArn']}")
+    return build_agent_response(event, json_dumps({
+        "Status": "InProgress",
+        "Message": "Deployment started",
+        "ExecutionArn": execution["executionArn"]
+    }))
+
+def provision_product_with_retry(max_attempts=10, **provision_kwargs):
+    """
+    Calls provision_product, retrying briefly while the portfolio association propagates.
+    
+    Key Steps:
+        1. Call sc.provision_product with the given arguments
+        2. On ResourceNotFoundException (launch path not visible yet), back off and retry
+        3. Make the last attempt outside the retry loop so its error propagates to the caller
+    
+    Parameters:
+        max_attempts (int, optional): Maximum number of provision attempts (default: 10)
+        **provision_kwargs: Arguments passed through to sc.provision_product
+    
+    Returns:
+        dict: The provision_product response
+    """
+    for attempt in range(max_attempts - 1):
+        try:
+            return get_client('servicecatalog').provision_product(**provision_kwargs)
+        except get_client('servicecatalog').exceptions.ResourceNotFoundException as e:
+            delay = min(0.2 * 2 ** attempt, 2.0)
+            LOGGER.info(f"In CFTGenerationAgentLambda.py.provision_product_with_retry(), product not yet provisionable ({e}), retrying in {delay}s")
+            time.sleep(delay)
+    return get_client('servicecatalog').provision_product(**provision_kwargs)
+
+def create_portfolio_product(product_name, template_url):
+    """
+    Creates a Service Catalog product from the CFT and associates it with the portfolio.
+    
+    Key Steps:
+        1. Create Service Catalog product with CFT template URL
+        2. Associate product with portfolio (provision_product_with_retry covers propagation)
+    
+    Parameters:
+        product_name (str): Name for the new product
+        template_url (str): S3 URL of the CFT template
+    
+    Returns:
+        tuple: (product_id, provisioning_artifact_id)
+    """
+    product = get_client('servicecatalog').create_product(
+        Name=product_name,
+        Owner='WB',
+        ProductType='CLOUD_FORMATION_TEMPLATE',
+        ProvisioningArtifactParameters={
+            'Name': 'v1',
+            'Description': 'Initial version uploaded by Agent',
+            'Info': {
+                'LoadTemplateFromURL': template_url
+            },
+            'Type': 'CLOUD_FORMATION_TEMPLATE'
+        }
+    )
+    product_id = product['ProductViewDetail']['ProductViewSummary']['ProductId']
+    artifact_id = product['ProvisioningArtifactDetail']['Id']
+    
+    # Associate product with portfolio
+    try:
+        get_client('servicecatalog').associate_product_with_portfolio(
+            ProductId=product_id,
+            PortfolioId=PORTFOLIO_ID
+        )
+        LOGGER.info(f"In CFTGenerationAgentLambda.py.create_portfolio_product(), successfully associated product {product_id} with portfolio {PORTFOLIO_ID}")
+    except Exception as e:
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.create_portfolio_product(), error associating product with portfolio: {e}")
+        raise Exception(f"Failed to associate product with portfolio: {str(e)}")
+
+    return product_id, artifact_id
+
+def get_cached_product(workspace_id, solution_id):
+    """
+    Looks up a Service Catalog product previously created from the solution's current CFT.
+    
+    Key Steps:
+        1. Read the cftsha256 digest from the live CFT object in S3
+           (objects written outside handle_cft_upload, e.g. presigned uploads, carry none)
+        2. Read ServiceCatalogProduct from the solution item
+        3. Return the cached product only if it was created from the live object's digest
+    
+    Parameters:
+        workspace_id (str): Workspace identifier
+        solution_id (str): Solution identifier
+    
+    Returns:
+        tuple: (template_hash, cached_product); cached_product is None when the product can't be reused
+    """
+    # The digest comes from the live S3 object, so templates replaced outside handle_cft_upload are detected
+    template_hash = stored_cft_hash(get_cft_s3_key(workspace_id, solution_id))
+    if not template_hash:
+        return None, None
+    try:
+        item = get_solutions_table().get_item(
+            Key={
+                'WorkspaceId': workspace_id,
+                'SolutionId': solution_id
+            },
+            ProjectionExpression='ServiceCatalogProduct'
+        ).get('Item', {})
+    except Exception as e:
+        LOGGER.warning(f"In CFTGenerationAgentLambda.py.get_cached_product(), could not read cached product: {e}")
+        return template_hash, None
+    cached_product = item.get('ServiceCatalogProduct') or {}
+    if cached_product.get('TemplateHash') == template_hash:
+        return template_hash, cached_product
+    return template_hash, None
+
+def cache_product(workspace_id, solution_id, template_hash, product_id, artifact_id):
+    """
+    Records the product created for the solution's template so later deployments can reuse it.
+    
+    Parameters:
+        workspace_id (str): Workspace identifier
+        solution_id (str): Solution identifier
+        template_hash (str): SHA-256 of the CFT the product was created from
+        product_id (str): Service Catalog product ID
+        artifact_id (str): Provisioning artifact ID
+    """
+    if not template_hash:
+        return
+    try:
+        get_solutions_table().update_item(
+            Key={
+                'WorkspaceId': workspace_id,
+                'SolutionId': solution_id
+            },
+            UpdateExpression='SET #p = :product',
+            ExpressionAttributeNames={
+                '#p': 'ServiceCatalogProduct'
+            },
+            ExpressionAttributeValues={
+                ':product': {
+                    'TemplateHash': template_hash,
+                    'ProductId': product_id,
+                    'ProvisioningArtifactId': artifact_id
+                }
+            }
+        )
+    except Exception as e:
+        LOGGER.warning(f"In CFTGenerationAgentLambda.py.cache_product(), could not cache product {product_id}: {e}")
 
 def execute_provision_phase(provisioning_parameters, tags, workspace_id, solution_id):
     """
@@ -296,12 +700,9 @@ def execute_provision_phase(provisioning_parameters, tags, workspace_id, solutio
     
     Key Steps:
         1. Generate unique product name with timestamp
-        2. Create Service Catalog product with CFT template URL
-        3. Associate product with portfolio
-        4. Wait for association to propagate
-        5. Verify product association
-        6. Initiate product provisioning
-        7. Return record ID and product name
+        2. Reuse the product cached for this template, or create and associate a new one
+        3. Initiate product provisioning, retrying until the association propagates
+        4. Return record ID and product name
     
     Parameters:
         provisioning_parameters (list): Service Catalog provisioning parameters
@@ -313,238 +714,189 @@ def execute_provision_phase(provisioning_parameters, tags, workspace_id, solutio
         dict: Phase result with record ID and provisioned product name
     """
     LOGGER.info("In CFTGenerationAgentLambda.py.execute_provision_phase(), provisioning product via Service Catalog")
-    global GLOBAL_S3_OBJECT_KEY
+    if USE_DIRECT_CFN:
+        return {
+            "phase": "error",
+            "error_message": "Provisioning failed during 'provision' phase: direct CloudFormation deployment is not supported by the Step Function phases"
+        }
+    if not workspace_id or not solution_id:
+        return {
+            "phase": "error",
+            "error_message": "Provisioning failed during 'provision' phase: no CFT template location available"
+        }
     provisioned_product_name = f"{PROVISIONED_PRODUCT_NAME_PREFIX}-{int(time.time())}"
     # Use the dynamic S3 URL for the template
     template_url = get_cft_s3_url(S3_OUTPUT_BUCKET, workspace_id, solution_id)
     LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), using CFT template URL for Service Catalog provisioning: {template_url}")
     try:
-        product = sc.create_product(
-            Name=provisioned_product_name,
-            Owner='WB',
-            ProductType='CLOUD_FORMATION_TEMPLATE',
-            ProvisioningArtifactParameters={
-                'Name': 'v1',
-                'Description': 'Initial version uploaded by Agent',
-                'Info': {
-                    'LoadTemplateFromURL': template_url
-                },
-                'Type': 'CLOUD_FORMATION_TEMPLATE'
-            }
-        )
-        product_id = product['ProductViewDetail']['ProductViewSummary']['ProductId']
-        artifact_id = product['ProvisioningArtifactDetail']['Id']
-        
-        # Associate product with portfolio
-        try:
-            sc.associate_product_with_portfolio(
-                ProductId=product_id,
-                PortfolioId=PORTFOLIO_ID
-            )
-            LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), successfully associated product {product_id} with portfolio {PORTFOLIO_ID}")
-        except Exception as e:
-            LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), error associating product with portfolio: {e}")
-            raise Exception(f"Failed to associate product with portfolio: {str(e)}")
-        
-        # Wait for association to propagate
-        LOGGER.info("In CFTGenerationAgentLambda.py.execute_provision_phase(), waiting for product association to propagate...")
-        time.sleep(10)
-        
-        # Verify the association was successful
-        try:
-            portfolio_detail = sc.describe_portfolio(Id=PORTFOLIO_ID)
-            associated_products = []
-            
-            # Check if there are any associated products
-            if 'AssociatedProducts' in portfolio_detail.get('PortfolioDetail', {}):
-                associated_products = [p['ProductId'] for p in portfolio_detail['PortfolioDetail']['AssociatedProducts']]
-            
-            if product_id not in associated_products:
-                LOGGER.warning(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), product {product_id} not found in associated products list")
-                # Try to verify by describing the product
-                try:
-                    product_detail = sc.describe_product(Id=product_id)
-                    LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), product {product_id} exists and is accessible")
-                except Exception as product_error:
-                    LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), error describing product {product_id}: {product_error}")
-                    raise Exception(f"Product {product_id} was not successfully associated with portfolio {PORTFOLIO_ID}")
-            
-            LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), product {product_id} successfully associated with portfolio {PORTFOLIO_ID}")
-        except Exception as e:
-            LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), error verifying product association: {e}")
-            LOGGER.warning("In CFTGenerationAgentLambda.py.execute_provision_phase(), could not verify product association, but continuing with provisioning")
-        
-        LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), attempting to provision product with ID: {product_id}, artifact ID: {artifact_id}")
-        LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), portfolio ID: {PORTFOLIO_ID}")
-        LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), provisioned product name: {provisioned_product_name}")
-        
-        try:
-            response = sc.provision_product(
-                ProductId=product_id,
-                ProvisioningArtifactId=artifact_id,
-                ProvisionedProductName=provisioned_product_name,
-                ProvisioningParameters=provisioning_parameters,
-                Tags=tags
-            )
-            LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), successfully initiated provisioning with record ID: {response['RecordDetail']['RecordId']}")
-        except Exception as provision_error:
-            LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), provisioning failed with error: {provision_error}")
-            
-            # Try to get more details about the product and portfolio
-            try:
-                product_detail = sc.describe_product(Id=product_id)
-                LOGGER.debug(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), product details: {product_detail}")
-            except Exception as e:
-                LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), could not get product details: {e}")
-            
+        provision_args = {
+            "ProvisionedProductName": provisioned_product_name,
+            "ProvisioningParameters": provisioning_parameters,
+            "Tags": tags
+        }
+        response = None
+        template_hash, cached_product = get_cached_product(workspace_id, solution_id)
+        if cached_product:
+            # Same template as the last deployment: the product already exists and is associated
+            product_id = cached_product['ProductId']
+            artifact_id = cached_product['ProvisioningArtifactId']
+            LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), reusing product {product_id} created from the same template")
             try:
-                portfolio_detail = sc.describe_portfolio(Id=PORTFOLIO_ID)
-                LOGGER.debug(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), portfolio details: {portfolio_detail}")
-            except Exception as e:
-                LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), could not get portfolio details: {e}")
-            
-            raise provision_error
+                response = provision_product_with_retry(max_attempts=1, ProductId=product_id, ProvisioningArtifactId=artifact_id, **provision_args)
+            except get_client('servicecatalog').exceptions.ResourceNotFoundException as e:
+                LOGGER.warning(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), cached product {product_id} is no longer provisionable, creating a new one: {e}")
+        if response is None:
+            product_id, artifact_id = create_portfolio_product(provisioned_product_name, template_url)
+            cache_product(workspace_id, solution_id, template_hash, product_id, artifact_id)
+            LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), provisioning product {product_id} (artifact {artifact_id}, portfolio {PORTFOLIO_ID}) as {provisioned_product_name}")
+            response = provision_product_with_retry(ProductId=product_id, ProvisioningArtifactId=artifact_id, **provision_args)
+        LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), successfully initiated provisioning with record ID: {response['RecordDetail']['RecordId']}")
         return {
             "phase": "poll",
             "RecordId": response['RecordDetail']['RecordId'],
             "provisioned_product_name": provisioned_product_name,
         }
     except Exception as e:
-        LOGGER.error(f"Error in Service Catalog provisioning: {e}")
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_provision_phase(), error in Service Catalog provisioning: {e}")
         return {
             "phase": "error",
             "error_message": f"Provisioning failed during 'provision' phase: {str(e)}"
         }
 
-def execute_polling_phase(record_id, provisioned_product_name, max_polls=60, poll_interval=30):
+def execute_polling_phase(record_id, provisioned_product_name, base_delay=RECORD_POLL_BASE_DELAY, max_delay=RECORD_POLL_MAX_DELAY, max_wait=RECORD_POLL_MAX_WAIT, resumable=False):
     """
     Polls the status of the Service Catalog product provisioning until completion.
     
     Key Steps:
-        1. Poll Service Catalog record status at specified intervals
-        2. Check for FAILED/ERROR status and return error
-        3. Check for SUCCEEDED status and return success
-        4. Continue polling for IN_PROGRESS status
-        5. Return timeout error if max polls exceeded
+        1. Call describe_record and match the response against the RecordSucceeded waiter acceptors
+        2. Back off exponentially with jitter between calls while the record is not terminal
+        3. Return success once the record reaches SUCCEEDED, error if it reaches FAILED/ERROR
+        4. Return timeout error if the overall wait budget is exceeded, or the "poll" phase when resumable
+        5. On success, hand the record outputs to finalize so it can skip another describe_record
     
     Parameters:
         record_id (str): Service Catalog record ID to monitor
         provisioned_product_name (str): Name of the provisioned product
-        max_polls (int, optional): Maximum number of polling attempts (default: 60)
-        poll_interval (int, optional): Seconds between polls (default: 30)
+        base_delay (float, optional): Backoff delay on the first retry, in seconds (default: 2.0)
+        max_delay (float, optional): Upper bound of the backoff delay, in seconds (default: 60.0)
+        max_wait (float, optional): Overall polling budget in seconds, kept under the Lambda timeout (default: 840)
+        resumable (bool, optional): Return the "poll" phase instead of a timeout error, so the Step Function can call again (default: False)
     
     Returns:
         dict: Phase result with status and error information if applicable
     """
     LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_polling_phase(), polling Service Catalog product with RecordId: {record_id}")
-    
-    for attempt in range(max_polls):
-        try:
-            response = sc.describe_record(Id=record_id)
-            status = response['RecordDetail']['Status']
-            LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_polling_phase(), poll attempt {attempt + 1}: Status = {status}")
-
-            # If the status is FAILED or ERROR, return an error message
-            if status in ["FAILED", "ERROR"]:
-                return {
-                    "phase": "error",
-                    "RecordId": record_id,
-                    "status": status,
-                    "error_message": response['RecordDetail'].get('StatusMessage', 'Provisioning failed.'),
-                    "provisioned_product_name": provisioned_product_name,
-                }
+    deadline = time.monotonic() + max_wait
+    attempt = 0
+    try:
+        while True:
+            response = get_client('servicecatalog').describe_record(Id=record_id)
+            state = next((a.state for a in RECORD_ACCEPTORS if a.matcher_func(response)), "waiting")
+            if state != "waiting":
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Still in progress (CREATED, IN_PROGRESS, IN_PROGRESS_IN_ERROR): back off with jitter
+            backoff = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(min(backoff / 2 + random.uniform(0, backoff / 2), remaining))
+            attempt += 1
+    except Exception as e:
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_polling_phase(), error polling Service Catalog product: {e}")
+        return {
+            "phase": "error",
+            "error_message": f"Provisioning failed during 'poll' phase: {str(e)}"
+        }
 
-            # If succeeded, return success
-            if status == "SUCCEEDED":
-                return {
-                    "phase": "finalize",
-                    "RecordId": record_id,
-                    "status": status,
-                    "provisioned_product_name": provisioned_product_name,
-                }
-            
-            # If still in progress, wait and continue polling
-            if status in ["CREATED", "IN_PROGRESS", "IN_PROGRESS_IN_ERROR"]:
-                time.sleep(poll_interval)
-                continue
-            
-        except Exception as e:
-            LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_polling_phase(), error polling Service Catalog product: {e}")
+    record_detail = response['RecordDetail']
+    status = record_detail['Status']
+    LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_polling_phase(), status {status} after {attempt + 1} polls")
+    # If the status is FAILED or ERROR, return an error message
+    if state == "failure":
+        return {
+            "phase": "error",
+            "RecordId": record_id,
+            "status": status,
+            "error_message": "; ".join(err.get('Description', '') for err in record_detail.get('RecordErrors', [])) or 'Provisioning failed.',
+            "provisioned_product_name": provisioned_product_name,
+        }
+    if state == "waiting":
+        if resumable:
             return {
-                "phase": "error",
-                "error_message": f"Provisioning failed during 'poll' phase: {str(e)}"
+                "phase": "poll",
+                "RecordId": record_id,
+                "status": status,
+                "provisioned_product_name": provisioned_product_name,
             }
-    
-    # If we've exceeded max polls
+        return {
+            "phase": "error",
+            "error_message": f"Provisioning timed out after {attempt + 1} polling attempts with status {status}"
+        }
+
     return {
-        "phase": "error",
-        "error_message": f"Provisioning timed out after {max_polls} polling attempts"
+        "phase": "finalize",
+        "RecordId": record_id,
+        "status": status,
+        "provisioned_product_name": provisioned_product_name,
+        # JSON-safe subset of the terminal DescribeRecord response, so it can also travel in Step Function state
+        "Record": {
+            "RecordOutputs": response.get('RecordOutputs', []),
+            "RecordDetail": {"ProvisionedProductId": record_detail.get('ProvisionedProductId')}
+        }
     }
 
-def execute_finalize_phase(record_id, provisioned_product_name):
+def list_stack_resources(stack_arn):
     """
-    Executes the finalization phase, extracting CloudFormation stack resources.
+    Lists every resource in a CloudFormation stack across all result pages.
     
     Key Steps:
-        1. Get Service Catalog record details
-        2. Extract CloudFormation stack ARN from record outputs
-        3. Fallback to provisioned product details if needed
-        4. Describe CloudFormation stack resources
-        5. Update solutions table with resource information
-        6. Return finalization result with resources
+        1. Page through ListStackResources (DescribeStackResources caps at 100 resources)
+        2. Fall back to a single DescribeStackResources call if listing is refused
+        3. Map each resource to logical ID, physical ID and type
     
     Parameters:
-        record_id (str): Service Catalog record ID
-        provisioned_product_name (str): Name of the provisioned product
+        stack_arn (str): CloudFormation stack ARN or name
     
     Returns:
-        dict: Finalization result with stack ARN and resource information
+        list: Resource dicts with LogicalResourceId, PhysicalResourceId and Type
     """
-    LOGGER.info("In CFTGenerationAgentLambda.py.execute_finalize_phase(), finalizing Service Catalog product")
-    global workspace_id, solution_id
+    cf = get_client('cloudformation')
     try:
-        record = sc.describe_record(Id=record_id)
-
-        stack_arn = None
-        for output in record.get('RecordOutputs', []):
-            if output['OutputKey'] == 'CloudformationStackARN':
-                stack_arn = output['OutputValue']
-                break
-
-        if not stack_arn:
-            try:
-                provisioned_product_detail = sc.describe_provisioned_product(
-                    Id=record['RecordDetail']['ProvisionedProductId']
-                )
-                stack_id_from_detail = provisioned_product_detail['ProvisionedProductDetail'].get('CloudformationStackId')
-                if stack_id_from_detail:
-                    # Extract stack name and ID from the stack ID
-                    stack_parts = stack_id_from_detail.split('/')
-                    if len(stack_parts) >= 3:
-                        region = boto3.Session().region_name or 'us-east-1'
-                        account_id = boto3.client('sts').get_caller_identity()['Account']
-                        stack_arn = f"arn:aws:cloudformation:{region}:{account_id}:stack/{stack_parts[1]}/{stack_parts[2]}"
-            except Exception as e:
-                LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_finalize_phase(), could not get stack ARN from provisioned product detail: {e}")
-        
-        if not stack_arn:
-            return {
-                "phase": "error",
-                "error_message": "CloudFormationStackARN not found in Service Catalog record outputs or provisioned product details."
-            }
-
-        resources = cf.describe_stack_resources(StackName=stack_arn)
-        res_list = [
-            {
-                "LogicalResourceId": r['LogicalResourceId'],
-                "PhysicalResourceId": r['PhysicalResourceId'],
-                "Type": r['ResourceType']
-            }
-            for r in resources['StackResources']
-        ]
+        resources = [r for page in cf.get_paginator('list_stack_resources').paginate(StackName=stack_arn) for r in page['StackResourceSummaries']]
+    except ClientError as e:
+        LOGGER.warning(f"In CFTGenerationAgentLambda.py.list_stack_resources(), listing stack resources failed, falling back to describe_stack_resources: {e}")
+        resources = cf.describe_stack_resources(StackName=stack_arn)['StackResources']
+    return [
+        {
+            "LogicalResourceId": r['LogicalResourceId'],
+            "PhysicalResourceId": r.get('PhysicalResourceId', ''),
+            "Type": r['ResourceType']
+        }
+        for r in resources
+    ]
 
-        # Update the solutions table with the resources in the required format
-        resource_items = [
+def store_deploy_result(workspace_id, solution_id, res_list, invoke_point=None, mark_ready=False):
+    """
+    Writes the outcome of a deployment to the solutions table in a single update.
+    
+    Key Steps:
+        1. Map resources to the ResourceName/ResourceId/Type format
+        2. Add the invoke point and READY status to the same SET expression when requested
+        3. Update the solutions table item, logging (not raising) on failure
+    
+    Parameters:
+        workspace_id (str): Workspace identifier
+        solution_id (str): Solution identifier
+        res_list (list): Resources as returned by list_stack_resources
+        invoke_point (str, optional): Invoke point to store in the Invocation column
+        mark_ready (bool, optional): Also set SolutionStatus to READY (default: False)
+    """
+    if not (workspace_id and solution_id):
+        return
+    set_clauses = ['#resource = :resource_list']
+    names = {'#resource': 'Resource'}
+    values = {
+        ':resource_list': [
             {
                 "ResourceName": r['LogicalResourceId'],
                 "ResourceId": r['PhysicalResourceId'],
@@ -552,230 +904,164 @@ def execute_finalize_phase(record_id, provisioned_product_name):
             }
             for r in res_list
         ]
-        if workspace_id and solution_id:
-            try:
-                SOLUTIONS_TABLE.update_item(
-                    Key={
-                        'WorkspaceId': workspace_id,
-                        'SolutionId': solution_id
-                    },
-                    UpdateExpression='SET #resource = :resource_list',
-                    ExpressionAttributeNames={
-                        '#resource': 'Resource'
-                    },
-                    ExpressionAttributeValues={
-                        ':resource_list': resource_items
-                    },
-                    ReturnValues='UPDATED_NEW'
-                )
-            except Exception as e:
-                LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_finalize_phase(), error updating Resource column in solutions table: {e}")
-
-        result = {
-            "phase": "done",
-            "CloudFormationStackARN": stack_arn,
-            "Resources": res_list,
-            "ProvisionedProductName": provisioned_product_name
-        }
-
-        LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_finalize_phase(), service catalog finalization result: {json.dumps(result)}")
-        return result
-        
+    }
+    if invoke_point:
+        set_clauses.append('#invoke = :invoke_point')
+        names['#invoke'] = 'Invocation'
+        values[':invoke_point'] = invoke_point
+    if mark_ready:
+        set_clauses.append('#s = :ready')
+        names['#s'] = 'SolutionStatus'
+        values[':ready'] = 'READY'
+    try:
+        get_solutions_table().update_item(
+            Key={
+                'WorkspaceId': workspace_id,
+                'SolutionId': solution_id
+            },
+            UpdateExpression='SET ' + ', '.join(set_clauses),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
     except Exception as e:
-        LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_finalize_phase(), error during finalization: {e}")
-        return {
-            "phase": "error",
-            "error_message": f"Provisioning failed during 'finalize' phase: {str(e)}"
-        }
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.store_deploy_result(), error updating solutions table: {e}")
 
-# Keep the original functions for backward compatibility or other use cases
-def handle_provision(event):
+def execute_direct_cfn_deploy(provisioning_parameters, tags, workspace_id, solution_id):
     """
-    Handles the Service Catalog product provisioning phase.
+    Deploys the CFT as a CloudFormation stack directly, skipping the Service Catalog product lifecycle.
     
     Key Steps:
-        1. Generate unique product name with timestamp
-        2. Create Service Catalog product with global S3 template URL
-        3. Associate product with portfolio
-        4. Wait for association to propagate
-        5. Initiate product provisioning
-        6. Return record ID and product name
+        1. Create the stack from the uploaded CFT template URL under the CFN_ROLE_ARN service role
+        2. Wait for CREATE_COMPLETE with the CloudFormation waiter
+        3. List the stack resources
+        4. Return a finalize-shaped result
     
     Parameters:
-        event (dict): Event containing provisioning parameters and tags
+        provisioning_parameters (list): Service Catalog style [{'Key', 'Value'}] parameters
+        tags (list): Tags to apply to the stack
+        workspace_id (str): Workspace identifier
+        solution_id (str): Solution identifier
     
     Returns:
-        dict: Phase result with record ID and provisioned product name
+        dict: Finalization result with stack ARN and resource information
     """
-    LOGGER.info("In CFTGenerationAgentLambda.py.handle_provision(), provisioning product via Service Catalog")
-    global GLOBAL_S3_OBJECT_KEY
-
-    provisioned_product_name = f"{PROVISIONED_PRODUCT_NAME_PREFIX}-{int(time.time())}"
-
-    # Use the global S3 object key to construct the template URL
-    if GLOBAL_S3_OBJECT_KEY:
-        template_url = f"https://{S3_OUTPUT_BUCKET}.s3.us-east-1.amazonaws.com/{GLOBAL_S3_OBJECT_KEY}"
-    LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_provision(), using CFT template URL for Service Catalog provisioning: {template_url}")
-
+    if not CFN_ROLE_ARN:
+        # Without a service role the stack would be created with this Lambda's own, narrow permissions
+        return {
+            "phase": "error",
+            "error_message": "Stack deployment failed: CFN_ROLE_ARN is not configured"
+        }
+    stack_name = f"{PROVISIONED_PRODUCT_NAME_PREFIX}-{int(time.time())}"
+    template_url = get_cft_s3_url(S3_OUTPUT_BUCKET, workspace_id, solution_id)
+    LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_direct_cfn_deploy(), creating stack {stack_name} from {template_url}")
+    create_args = {
+        "StackName": stack_name,
+        "TemplateURL": template_url,
+        "Parameters": [{"ParameterKey": p['Key'], "ParameterValue": p['Value']} for p in provisioning_parameters],
+        "Tags": tags,
+        "Capabilities": ['CAPABILITY_NAMED_IAM', 'CAPABILITY_AUTO_EXPAND'],
+        "RoleARN": CFN_ROLE_ARN
+    }
     try:
-        product = sc.create_product(
-            Name=provisioned_product_name,
-            Owner='WB',
-            ProductType='CLOUD_FORMATION_TEMPLATE',
-            ProvisioningArtifactParameters={
-                'Name': 'v1',
-                'Description': 'Initial version uploaded by Agent',
-                'Info': {
-                    'LoadTemplateFromURL': template_url
-                },
-                'Type': 'CLOUD_FORMATION_TEMPLATE'
-            }
+        stack_arn = get_client('cloudformation').create_stack(**create_args)['StackId']
+        get_client('cloudformation').get_waiter('stack_create_complete').wait(
+            StackName=stack_arn,
+            WaiterConfig={'Delay': 5, 'MaxAttempts': 120}
         )
-        product_id = product['ProductViewDetail']['ProductViewSummary']['ProductId']
-        artifact_id = product['ProvisioningArtifactDetail']['Id']
-
-        sc.associate_product_with_portfolio(
-            ProductId=product_id,
-            PortfolioId=PORTFOLIO_ID
-        )
-
-        time.sleep(5)
-
-        response = sc.provision_product(
-            ProductId=product_id,
-            ProvisioningArtifactId=artifact_id,
-            ProvisionedProductName=provisioned_product_name,
-            ProvisioningParameters=event.get('provisioning_parameters', []),
-            Tags=event.get('tags', [])
-        )
-
+        res_list = list_stack_resources(stack_arn)
         return {
-            "phase": "poll",
-            "RecordId": response['RecordDetail']['RecordId'],
-            "provisioned_product_name": provisioned_product_name,
+            "phase": "done",
+            "CloudFormationStackARN": stack_arn,
+            "Resources": res_list,
+            "ProvisionedProductName": stack_name
         }
     except Exception as e:
-        LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_provision(), error in Service Catalog provisioning: {e}")
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_direct_cfn_deploy(), error deploying stack: {e}")
         return {
             "phase": "error",
-            "error_message": f"Provisioning failed during 'provision' phase: {str(e)}"
+            "error_message": f"Stack deployment failed: {str(e)}"
         }
 
-def handle_poll(event):
+def resolve_stack_arn(record):
     """
-    Handles polling the status of the Service Catalog product provisioning.
+    Resolves the CloudFormation stack ARN for a Service Catalog record.
     
     Key Steps:
-        1. Extract record ID from event
-        2. Poll Service Catalog record status
-        3. Check for FAILED/ERROR status and return error
-        4. Return appropriate phase based on status
+        1. Return the CloudformationStackARN record output when present (no API calls)
+        2. Otherwise fall back to describe_provisioned_product and build the ARN
     
     Parameters:
-        event (dict): Event containing record ID and provisioned product name
+        record (dict): describe_record response
     
     Returns:
-        dict: Phase result with status and error information if applicable
+        str: Stack ARN, or None if it could not be resolved
     """
-    LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_poll(), polling Service Catalog product with RecordId: {event['RecordId']}")
-    record_id = event['RecordId']
-    try:
-        response = sc.describe_record(Id=record_id)
-        status = response['RecordDetail']['Status']
-
-        # If the status is FAILED or ERROR, return an error message
-        if status in ["FAILED", "ERROR"]:
-            return {
-                "phase": "error",
-                "RecordId": record_id,
-                "status": status,
-                "error_message": response['RecordDetail'].get('StatusMessage', 'Provisioning failed.'),
-                "provisioned_product_name": event.get("provisioned_product_name"),
-            }
+    stack_arn = next(
+        (o['OutputValue'] for o in record.get('RecordOutputs', ()) if o['OutputKey'] == 'CloudformationStackARN'),
+        None
+    )
+    if stack_arn:
+        return stack_arn
 
-        return {
-            "phase": "finalize" if status == "SUCCEEDED" else "poll",
-            "RecordId": record_id,
-            "status": status,
-            "provisioned_product_name": event.get("provisioned_product_name"),
-        }
+    try:
+        provisioned_product_detail = get_client('servicecatalog').describe_provisioned_product(
+            Id=record['RecordDetail']['ProvisionedProductId']
+        )
+        stack_id_from_detail = provisioned_product_detail['ProvisionedProductDetail'].get('CloudformationStackId')
+        if stack_id_from_detail:
+            # Extract stack name and ID from the stack ID
+            stack_parts = stack_id_from_detail.split('/')
+            if len(stack_parts) >= 3:
+                account_id, region = get_account_and_region()
+                return f"arn:aws:cloudformation:{region}:{account_id}:stack/{stack_parts[1]}/{stack_parts[2]}"
     except Exception as e:
-        LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_poll(), error polling Service Catalog product: {e}")
-        return {
-            "phase": "error",
-            "error_message": f"Provisioning failed during 'poll' phase: {str(e)}"
-        }
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.resolve_stack_arn(), could not get stack ARN from provisioned product detail: {e}")
+    return None
 
-def handle_finalize(event, context=None):
+def execute_finalize_phase(record_id, provisioned_product_name, record=None):
     """
-    Handles the finalization phase, extracting CloudFormation stack resources.
+    Executes the finalization phase, extracting CloudFormation stack resources.
     
     Key Steps:
-        1. Get Service Catalog record details
-        2. Extract CloudFormation stack ARN from record outputs
-        3. Fallback to provisioned product details if needed
-        4. Describe CloudFormation stack resources
-        5. Return finalization result with resources
+        1. Get Service Catalog record details, unless the poll phase already passed them in
+        2. Resolve the CloudFormation stack ARN (record outputs first, provisioned product as fallback)
+        3. List all CloudFormation stack resources
+        4. Return finalization result with resources (the caller stores them)
     
     Parameters:
-        event (dict): Event containing record ID and provisioned product name
-        context (object, optional): Lambda context for extracting account/region info
+        record_id (str): Service Catalog record ID
+        provisioned_product_name (str): Name of the provisioned product
+        record (dict, optional): "Record" from the poll result (RecordOutputs and RecordDetail.ProvisionedProductId)
     
     Returns:
         dict: Finalization result with stack ARN and resource information
     """
-    LOGGER.info("In CFTGenerationAgentLambda.py.handle_finalize(), finalizing Service Catalog product")
-    record_id = event['RecordId']
-    product_name = event.get('provisioned_product_name')
+    LOGGER.info("In CFTGenerationAgentLambda.py.execute_finalize_phase(), finalizing Service Catalog product")
     try:
-        record = sc.describe_record(Id=record_id)
-
-        stack_arn = None
-        for output in record.get('RecordOutputs', []):
-            if output['OutputKey'] == 'CloudformationStackARN':
-                stack_arn = output['OutputValue']
-                break
+        record = record or get_client('servicecatalog').describe_record(Id=record_id)
 
-        if not stack_arn:
-            try:
-                provisioned_product_detail = sc.describe_provisioned_product(
-                    Id=record['RecordDetail']['ProvisionedProductId']
-                )
-                stack_id_from_detail = provisioned_product_detail['ProvisionedProductDetail'].get('CloudformationStackId')
-                if stack_id_from_detail and context:
-                    account_id = context.invoked_function_arn.split(":")[4]
-                    region = context.invoked_function_arn.split(":")[3]
-                    stack_arn = f"arn:aws:cloudformation:{region}:{account_id}:stack/{stack_id_from_detail.split('/')[1]}/{stack_id_from_detail.split('/')[2]}"
-            except Exception as e:
-                LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_finalize(), could not get stack ARN from provisioned product detail: {e}")
-                pass
+        stack_arn = resolve_stack_arn(record)
         if not stack_arn:
             return {
                 "phase": "error",
                 "error_message": "CloudFormationStackARN not found in Service Catalog record outputs or provisioned product details."
             }
 
-        resources = cf.describe_stack_resources(StackName=stack_arn)
-        res_list = [
-            {
-                "LogicalResourceId": r['LogicalResourceId'],
-                "PhysicalResourceId": r['PhysicalResourceId'],
-                "Type": r['ResourceType']
-            }
-            for r in resources['StackResources']
-        ]
+        res_list = list_stack_resources(stack_arn)
 
         result = {
             "phase": "done",
             "CloudFormationStackARN": stack_arn,
             "Resources": res_list,
-            "ProvisionedProductName": product_name
+            "ProvisionedProductName": provisioned_product_name
         }
 
-        LOGGER.info(f"In CFTGenerationAgentLambda.py.handle_finalize(), service catalog finalization result: {json.dumps(result)}")
+        LOGGER.info(f"In CFTGenerationAgentLambda.py.execute_finalize_phase(), finalized stack {stack_arn} with {len(res_list)} resources")
+        LOGGER.debug("In CFTGenerationAgentLambda.py.execute_finalize_phase(), service catalog finalization result: %s", result)
         return result
+        
     except Exception as e:
-        LOGGER.error(f"In CFTGenerationAgentLambda.py.handle_finalize(), error during finalization: {e}")
+        LOGGER.error(f"In CFTGenerationAgentLambda.py.execute_finalize_phase(), error during finalization: {e}")
         return {
             "phase": "error",
             "error_message": f"Provisioning failed during 'finalize' phase: {str(e)}"
@@ -783,11 +1069,16 @@ def handle_finalize(event, context=None):
 
 def lambda_handler(event, context):
     
-    try:
-        LOGGER.info(f"In CFTGenerationAgentLambda.py.lambda_handler(), received event: {json.dumps(event)}")
+    # Check if this is an agent call (decided first: the error handler below depends on it)
+    is_agent_call = "actionGroup" in event and "function" in event
 
-        # Check if this is an agent call
-        is_agent_call = "actionGroup" in event and "function" in event
+    try:
+        LOGGER.info(f"In CFTGenerationAgentLambda.py.lambda_handler(), received function={event.get('function')} phase={event.get('phase')}")
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug("In CFTGenerationAgentLambda.py.lambda_handler(), received event: %s", redact_event(event))
+        # Seed the account/region cache from the function ARN so finalize never needs STS
+        if context is not None and ACCOUNT_ID is None:
+            get_account_and_region(context)
         
         if is_agent_call:
             function_name = event.get("function")
@@ -808,44 +1099,51 @@ def lambda_handler(event, context):
             LOGGER.info("In CFTGenerationAgentLambda.py.lambda_handler(), handling Step Function callback for Service Catalog phases.")
             phase = event.get("phase")
 
+            if phase == "worker_pipeline":
+                # Asynchronous deploycft worker: nobody waits on the result, the solutions table records it
+                result = run_deploy_pipeline(event.get("workspace_id"), event.get("solution_id"), event.get("invoke_point"))
+                if result.get("phase") == "error":
+                    LOGGER.error(f"In CFTGenerationAgentLambda.py.lambda_handler(), deployment worker failed: {result.get('error_message')}")
+                return result
+
             if phase == "provision":
-                result = handle_provision(event)
+                result = execute_provision_phase(
+                    event.get('provisioning_parameters', []),
+                    event.get('tags', []),
+                    event.get("workspace_id"),
+                    event.get("solution_id")
+                )
             elif phase == "poll":
-                result = handle_poll(event)
+                # Wait in this invocation for as long as the timeout allows; the Step Function only loops if that runs out
+                max_wait = context.get_remaining_time_in_millis() / 1000 - POLL_TIME_MARGIN if context else 0
+                result = execute_polling_phase(event['RecordId'], event.get("provisioned_product_name"), max_wait=max_wait, resumable=True)
             elif phase == "finalize":
-                result = handle_finalize(event, context)
+                result = execute_finalize_phase(event['RecordId'], event.get("provisioned_product_name"), event.get("Record"))
             else:
                 raise ValueError(f"Unknown phase in Step Function input: {phase}")
 
+            # Carry workspace/solution context forward to the next phase
+            for key in PHASE_CONTEXT_KEYS:
+                if key in event:
+                    result.setdefault(key, event[key])
+
             # If the phase is error, return a user-facing error message
             if result.get("phase") == "error":
                 return build_agent_response(event, f"Provisioning failed: {result.get('error_message', 'Unknown error')}")
-            elif phase == "finalize":
-
-                #upadte the solution table status field to "READY"
-                global workspace_id, solution_id
-                if workspace_id and solution_id:
-                    response = SOLUTIONS_TABLE.update_item(
-                        Key={
-                            'WorkspaceId': workspace_id,
-                            'SolutionId': solution_id
-                        },
-                        UpdateExpression='SET #s = :ready',
-                        ExpressionAttributeNames={
-                            '#s': 'SolutionStatus'
-                        },
-                        ExpressionAttributeValues={
-                            ':ready': 'READY'
-                        },
-                        ReturnValues='UPDATED_NEW'
-                    )
-
-                result = handle_finalize(event, context)
-                
-                return build_agent_response(event, f"{result}")
-            else:
+            if phase != "finalize":
                 return result
 
+            # Finalize ran exactly once above; record resources, invoke point and READY status in one write
+            store_deploy_result(
+                event.get("workspace_id"),
+                event.get("solution_id"),
+                result["Resources"],
+                event.get("invoke_point"),
+                mark_ready=True
+            )
+
+            return build_agent_response(event, json_dumps(result))
+
     except Exception as e:
         LOGGER.error(f"In CFTGenerationAgentLambda.py.lambda_handler(), error during Lambda execution: {str(e)}")
         if not is_agent_call: